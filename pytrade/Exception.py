@@ -52,3 +52,34 @@ class InvalidOpenPriceException(TradingEnvException):
 class NoPriceException(TradingEnvException):
     def __init__(self, time):
         self.message = "No Price On Time: " + str(time)
+
+
+class JournalFormatException(TradingEnvException):
+    def __init__(self, file_name):
+        self.message = "Journal File: " + file_name + " Is Illegal."
+
+
+class BatchLengthException(TradingEnvException):
+    def __init__(self, argument, length, expected):
+        self.message = "Argument " + str(argument) + ": Length " + str(length) + \
+                       " Does Not Match " + str(expected) + " Orders."
+
+
+class DuplicateOrderException(TradingEnvException):
+    def __init__(self, identifier):
+        self.message = "Order #" + str(identifier) + ": Selected More Than Once."
+
+
+class InvalidTimeframeException(TradingEnvException):
+    def __init__(self, timeframe):
+        self.message = "Timeframe: " + str(timeframe) + " Invalid."
+
+
+class InvalidLotException(TradingEnvException):
+    def __init__(self, lot):
+        self.message = "Lot: " + str(lot) + " Invalid."
+
+
+class InvalidBalanceException(TradingEnvException):
+    def __init__(self, money):
+        self.message = "Balance=" + str(money) + ": Not Positive."
@@ -0,0 +1,215 @@
+from Order import Order
+from Exception import JournalFormatException
+from collections import OrderedDict
+import numpy as np
+import struct
+import errno
+import sys
+import os
+
+
+class Event:
+    def __init__(self):
+        pass
+
+    send = 0      # order sent
+    modify = 1    # order modified
+    activate = 2  # pending order activated
+    close = 3     # order closed
+
+    no_reason = 0xff  # event without an Order.Reason
+
+
+MAGIC = b"PTJRNL02"
+
+# event, reason, (padding), identifier, op, time, expired_time, price, lot, tp, sl
+RECORD = struct.Struct("<BBHIIiidddd")
+RECORD_DTYPE = np.dtype([
+    ("event", "<u1"),
+    ("reason", "<u1"),
+    ("padding", "<u2"),
+    ("identifier", "<u4"),
+    ("op", "<u4"),
+    ("time", "<i4"),
+    ("expired_time", "<i4"),
+    ("price", "<f8"),
+    ("lot", "<f8"),
+    ("tp", "<f8"),
+    ("sl", "<f8"),
+])
+
+
+def _level(value):
+    return float("nan") if value is None else value
+
+
+def _value(level):
+    return None if np.isnan(level) else float(level)
+
+
+def _time(time):
+    return -1 if time is None else time
+
+
+def _time_value(time):
+    return None if time < 0 else time
+
+
+class Journal:
+    """Append-only order event journal.
+
+    Every event is packed into a fixed 52 byte record and kept in memory until
+    [int]buffer_size records are pending, so the trading loop only pays for a
+    struct pack per event. Missing tp or sl levels are written as NaN, missing
+    times as -1.
+
+    An existing file is never overwritten, so that the journal of a previous
+    run stays available to diff against: when [str]file_name is taken, a run
+    number is added before its extension (run.jnl, run.1.jnl, run.2.jnl, ...)
+    and [str]file_name is set to the file actually written.
+    """
+    def __init__(self, file_name, buffer_size=4096):
+        self.buffer_size = buffer_size
+        self.buffer = []
+        base, ext = os.path.splitext(file_name)
+        run = 0
+        while True:
+            self.file_name = file_name if run == 0 else base + "." + str(run) + ext
+            try:
+                fd = os.open(self.file_name, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0))
+                break
+            except OSError as ex:
+                if ex.errno != errno.EEXIST:
+                    raise
+                run += 1
+        self.fp = os.fdopen(fd, "wb")
+        self.fp.write(MAGIC)
+
+    def record(self, event, order, time, price, reason=Event.no_reason):
+        self.buffer.append(RECORD.pack(
+            event,
+            reason,
+            0,
+            order.identifier,
+            order.op,
+            _time(time),
+            _time(order.expired_time),
+            price,
+            order.lot,
+            _level(order.tp),
+            _level(order.sl)
+        ))
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.fp.write(b"".join(self.buffer))
+            self.buffer = []
+        self.fp.flush()
+
+    def close(self):
+        self.flush()
+        self.fp.close()
+
+
+class JournalReader:
+    """Memory-mapped view over the records of a journal file.
+
+    records: structured numpy array with the fields of RECORD_DTYPE
+    orders: replay the events to rebuild the order history
+    equity: realized balance after each close event
+    """
+    def __init__(self, file_name):
+        self.file_name = file_name
+        with open(file_name, "rb") as fp:
+            header = fp.read(len(MAGIC))
+            fp.seek(0, 2)
+            size = fp.tell() - len(MAGIC)
+        if header != MAGIC or size % RECORD_DTYPE.itemsize != 0:
+            raise JournalFormatException(file_name)
+
+        if size == 0:
+            self.records = np.empty(0, dtype=RECORD_DTYPE)
+        else:
+            self.records = np.memmap(file_name, dtype=RECORD_DTYPE, mode="r", offset=len(MAGIC))
+
+    def __len__(self):
+        return len(self.records)
+
+    def orders(self):
+        """Returns (hist_orders, active_orders) as OrderList keeps them."""
+        hist_orders = OrderedDict()
+        active_orders = OrderedDict()
+        for rec in self.records.tolist():
+            event, reason, _, identifier, op, time, expired_time, price, lot, tp, sl = rec
+            if event == Event.send:
+                active_orders[identifier] = Order(op, identifier, time, price, lot, _time_value(expired_time),
+                                                  reason, _value(tp), _value(sl))
+                continue
+
+            order = active_orders[identifier]
+            order.tp = _value(tp)
+            order.sl = _value(sl)
+            order.expired_time = _time_value(expired_time)
+            if event == Event.modify:
+                order.open_price = price
+            elif event == Event.activate:
+                order.op = op
+                order.open_price = price
+                order.open_reason = reason
+            elif event == Event.close:
+                order.close(time, price, reason)
+                hist_orders[identifier] = order
+                del active_orders[identifier]
+        return hist_orders, active_orders
+
+    def equity(self, initial_balance=0):
+        """Returns (close times, realized balance after each close).
+
+        Unlike the mark-to-market balance plotted by TradingEnvironment.run,
+        only closed positions contribute. Pending orders cancelled before
+        being activated leave the balance unchanged.
+        """
+        records = self.records
+        opened = (records["event"] == Event.send) | (records["event"] == Event.activate)
+        open_prices = dict(zip(records["identifier"][opened].tolist(),
+                               records["price"][opened].tolist()))
+
+        closes = records[records["event"] == Event.close]
+        entry = np.array([open_prices[i] for i in closes["identifier"].tolist()], dtype=np.float64)
+        direction = np.where(closes["op"] == Order.Operation.op_b, 1.0,
+                             np.where(closes["op"] == Order.Operation.op_s, -1.0, 0.0))
+        pnl = (closes["price"] - entry) * closes["lot"] * direction
+        return np.array(closes["time"]), initial_balance + np.cumsum(pnl)
+
+
+def diff_journals(file_a, file_b):
+    """Compare two journals event by event.
+
+    Returns a list of (index, record_a, record_b) for every position at which
+    the records differ. A record missing from the shorter journal is None.
+    NaN tp or sl levels compare equal to each other.
+    """
+    a = JournalReader(file_a).records
+    b = JournalReader(file_b).records
+    n = min(len(a), len(b))
+
+    differs = np.zeros(n, dtype=bool)
+    for name in RECORD_DTYPE.names:
+        x = a[name][:n]
+        y = b[name][:n]
+        if x.dtype.kind == "f":
+            differs |= ~((x == y) | (np.isnan(x) & np.isnan(y)))
+        else:
+            differs |= x != y
+
+    diffs = [(i, a[i].tolist(), b[i].tolist()) for i in np.flatnonzero(differs).tolist()]
+    diffs += [(i, a[i].tolist(), None) for i in range(n, len(a))]
+    diffs += [(i, None, b[i].tolist()) for i in range(n, len(b))]
+    return diffs
+
+
+if __name__ == '__main__':
+    for index, rec_a, rec_b in diff_journals(sys.argv[1], sys.argv[2]):
+        print("#" + str(index) + ": " + str(rec_a) + " != " + str(rec_b))
@@ -0,0 +1,118 @@
+from Order import Order
+import numpy as np
+
+
+class Action:
+    def __init__(self):
+        pass
+
+    activate = 0   # pending order activated
+    close_tp = 1   # position closed at take profit
+    close_sl = 2   # position closed at stop loss
+
+
+class OrderBook:
+    """Columns of the active orders, kept in step with OrderList.
+
+    OrderList adds, updates and removes the rows as orders are sent, modified,
+    activated and closed, so that match() is pure array work. A closed order's
+    row is filled with the last row, hence the rows are not in sending order.
+    Missing tp or sl levels are stored as NaN so that every comparison against
+    them is False, with the invalid value warnings of numpy silenced.
+
+    Below [int]min_size orders the fixed cost of the array operations is
+    higher than the per-order loop of TradingEnvironment.run.
+    """
+    min_size = 64
+
+    def __init__(self, capacity=64):
+        self.size = 0
+        self.rows = {}
+        self.identifiers = np.empty(capacity, dtype=np.int64)
+        self.ops = np.empty(capacity, dtype=np.int64)
+        self.open_prices = np.empty(capacity, dtype=np.float64)
+        self.tps = np.empty(capacity, dtype=np.float64)
+        self.sls = np.empty(capacity, dtype=np.float64)
+
+    def __reserve(self, size):
+        capacity = len(self.ops)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for name in ("identifiers", "ops", "open_prices", "tps", "sls"):
+            column = getattr(self, name)
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    def __set(self, row, order):
+        self.identifiers[row] = order.identifier
+        self.ops[row] = order.op
+        self.open_prices[row] = order.open_price
+        self.tps[row] = np.nan if order.tp is None else order.tp
+        self.sls[row] = np.nan if order.sl is None else order.sl
+
+    def add(self, order):
+        self.__reserve(self.size + 1)
+        self.__set(self.size, order)
+        self.rows[order.identifier] = self.size
+        self.size += 1
+
+    def add_many(self, orders):
+        orders = list(orders)
+        begin, end = self.size, self.size + len(orders)
+        self.__reserve(end)
+        self.identifiers[begin:end] = [order.identifier for order in orders]
+        self.ops[begin:end] = [order.op for order in orders]
+        self.open_prices[begin:end] = [order.open_price for order in orders]
+        self.tps[begin:end] = [np.nan if order.tp is None else order.tp for order in orders]
+        self.sls[begin:end] = [np.nan if order.sl is None else order.sl for order in orders]
+        self.rows.update((order.identifier, begin + i) for i, order in enumerate(orders))
+        self.size = end
+
+    def update(self, order):
+        self.__set(self.rows[order.identifier], order)
+
+    def remove(self, identifier):
+        row = self.rows.pop(identifier)
+        last = self.size - 1
+        if row != last:
+            for column in (self.identifiers, self.ops, self.open_prices, self.tps, self.sls):
+                column[row] = column[last]
+            self.rows[int(self.identifiers[row])] = row
+        self.size = last
+
+    def match(self, prev_price, new_price):
+        """Evaluate the activation and tp/sl conditions of all the orders at once.
+
+        [double]prev_price: close price of the previous bar
+
+        [double]new_price: close price of the current bar
+
+        Returns (identifiers, actions) of the triggered orders only, in sending
+        order as OrderList.active_orders keeps them.
+        """
+        n = self.size
+        ops = self.ops[:n]
+
+        with np.errstate(invalid="ignore"):
+            if new_price > prev_price:
+                # when price goes up
+                activated = ((ops & Order.Operation.aux_is_bs_sl) != 0) & (self.open_prices[:n] < new_price)
+                close_tp = (ops == Order.Operation.op_b) & (self.tps[:n] < new_price)
+                close_sl = (ops == Order.Operation.op_s) & (self.sls[:n] < new_price)
+            else:
+                # when price goes down
+                activated = ((ops & Order.Operation.aux_is_bl_ss) != 0) & (self.open_prices[:n] > new_price)
+                close_sl = (ops == Order.Operation.op_b) & (self.sls[:n] > new_price)
+                close_tp = (ops == Order.Operation.op_s) & (self.tps[:n] > new_price)
+
+        triggered = np.flatnonzero(activated | close_tp | close_sl)
+        if not len(triggered):
+            return [], []
+        # identifiers grow with every order sent, so they give the sending order
+        triggered = triggered[np.argsort(self.identifiers[triggered])]
+        actions = np.where(activated[triggered], Action.activate,
+                           np.where(close_tp[triggered], Action.close_tp, Action.close_sl))
+        return self.identifiers[triggered].tolist(), actions.tolist()
@@ -53,7 +53,7 @@ class Order:
         op_sl = 0x10001001  # sell limit
 
         aux_is_b = 0x00000000      # is buy
-        aux_is_mkt = 0x10000000    # is market order
+        aux_is_mkt = 0x10000000    # is pending (not market) order
         aux_is_bs_sl = 0x00001000  # is buy stop or sell limit
         aux_is_bl_ss = 0x00010000  # is buy limit or sell stop
 
@@ -63,7 +63,7 @@ class Order:
 
         @classmethod
         def is_market(cls, opr):
-            return opr & cls.aux_is_mkt
+            return (opr & cls.aux_is_mkt) == 0
 
         @classmethod
         def is_bs_or_sl(cls, opr):
@@ -1,8 +1,15 @@
 from Order import *
 from Common import singleton
+from Journal import Event
 from collections import OrderedDict
 
 
+def _check_lengths(n, **columns):
+    for name, column in columns.items():
+        if column is not None and len(column) != n:
+            raise BatchLengthException(name, len(column), n)
+
+
 class SelectMethod:
     def __init__(self):
         pass
@@ -58,6 +65,8 @@ class OrderList:
     hist_orders = OrderedDict()
     active_orders = OrderedDict()
     selected_order = None
+    journal = None
+    book = None
 
     identifier = 0
 
@@ -83,12 +92,37 @@ class OrderList:
         identifier = self.new_identifier
         self.active_orders[identifier] = \
             Order(op, identifier, open_time, open_price, lot, expired_time, open_reason, tp, sl)
+        if self.journal is not None:
+            self.journal.record(Event.send, self.active_orders[identifier], open_time, open_price, open_reason)
+        if self.book is not None:
+            self.book.add(self.active_orders[identifier])
         if op == Order.Operation.op_b:
             self.naked += lot
         elif op == Order.Operation.op_s:
             self.naked -= lot
         return identifier
 
+    def order_send_many(self, ops, open_time, open_prices, lots, expired_times,
+                        open_reason=Order.Reason.open_at_mk, tps=None, sls=None):
+        n = len(ops)
+        _check_lengths(n, open_prices=open_prices, lots=lots, expired_times=expired_times, tps=tps, sls=sls)
+        tps = [None] * n if tps is None else tps
+        sls = [None] * n if sls is None else sls
+        identifiers = list(range(self.identifier + 1, self.identifier + n + 1))
+        self.identifier += n
+        orders = [Order(op, identifier, open_time, open_price, lot, expired_time, open_reason, tp, sl)
+                  for op, identifier, open_price, lot, expired_time, tp, sl
+                  in zip(ops, identifiers, open_prices, lots, expired_times, tps, sls)]
+        self.active_orders.update(zip(identifiers, orders))
+        if self.book is not None:
+            self.book.add_many(orders)
+        if self.journal is not None:
+            for order in orders:
+                self.journal.record(Event.send, order, open_time, order.open_price, open_reason)
+        self.naked += sum(lot for op, lot in zip(ops, lots) if op == Order.Operation.op_b) - \
+            sum(lot for op, lot in zip(ops, lots) if op == Order.Operation.op_s)
+        return identifiers
+
     def order_close(self, identifier, close_time, close_price, close_reason):
         try:
             to_close = self.active_orders[identifier]
@@ -97,12 +131,46 @@ class OrderList:
             elif to_close.op == Order.Operation.op_s:
                 self.naked += to_close.lot
             self.active_orders[identifier].close(close_time, close_price, close_reason)
+            if self.journal is not None:
+                self.journal.record(Event.close, to_close, close_time, close_price, close_reason)
             self.hist_orders[identifier] = self.active_orders[identifier]
             del self.active_orders[identifier]
+            if self.book is not None:
+                self.book.remove(identifier)
 
         except KeyError:
             raise OrderNotFoundException(identifier)
 
+    def order_close_many(self, identifiers, close_time, close_price, close_reason):
+        to_close = self.order_select_many(identifiers)
+        naked = sum(order.lot for order in to_close if order.op == Order.Operation.op_s) - \
+            sum(order.lot for order in to_close if order.op == Order.Operation.op_b)
+        for order in to_close:
+            order.close(close_time, close_price, close_reason)
+            self.hist_orders[order.identifier] = order
+            del self.active_orders[order.identifier]
+            if self.book is not None:
+                self.book.remove(order.identifier)
+            if self.journal is not None:
+                self.journal.record(Event.close, order, close_time, close_price, close_reason)
+        self.naked += naked
+
+    def order_select_many(self, identifiers):
+        """Returns the active orders of the identifiers, without changing the selected order."""
+        orders = []
+        selected = set()
+        for identifier in identifiers:
+            if identifier in selected:
+                raise DuplicateOrderException(identifier)
+            selected.add(identifier)
+            if identifier in self.active_orders:
+                orders.append(self.active_orders[identifier])
+            elif identifier in self.hist_orders:
+                raise SelectedOrderClosedException(identifier)
+            else:
+                raise OrderNotFoundException(identifier)
+        return orders
+
     def order_select(self, identifier, select_mode=SelectMethod.by_pos):
         if select_mode == SelectMethod.by_pos:
             if identifier >= len(self.active_orders.items()):
@@ -118,25 +186,47 @@ class OrderList:
 
         return self.selected_order
 
-    def order_modify(self, identifier=None, new_price=None, new_tp=None, new_sl=None, expired_time=None):
+    def order_modify(self, identifier=None, new_price=None, new_tp=None, new_sl=None, expired_time=None,
+                     time=None):
         if identifier is not None:
             self.order_select(identifier, SelectMethod.by_ticket)
         if self.selected_order.closed:
             raise SelectedOrderClosedException(self.selected_order.identifier)
         else:
             self.selected_order.modify(new_price, new_tp, new_sl, expired_time)
+            if self.book is not None:
+                self.book.update(self.selected_order)
+            if self.journal is not None:
+                self.journal.record(Event.modify, self.selected_order, time, self.selected_order.open_price)
+
+    def order_modify_many(self, identifiers, new_prices, new_tps, new_sls, expired_times, time=None):
+        orders = self.order_select_many(identifiers)
+        _check_lengths(len(orders), new_prices=new_prices, new_tps=new_tps, new_sls=new_sls,
+                       expired_times=expired_times)
+        for order, new_price, new_tp, new_sl, expired_time \
+                in zip(orders, new_prices, new_tps, new_sls, expired_times):
+            order.modify(new_price, new_tp, new_sl, expired_time)
+            if self.book is not None:
+                self.book.update(order)
+            if self.journal is not None:
+                self.journal.record(Event.modify, order, time, order.open_price)
 
-    def order_activate(self, price, identifier=None):
+    def order_activate(self, price, identifier=None, time=None):
         if identifier is not None:
             self.order_select(identifier, SelectMethod.by_ticket)
         if self.selected_order.closed:
             raise MarketOrderActivatedException(self.selected_order.identifier)
         else:
             self.selected_order.activate(price)
+            if self.book is not None:
+                self.book.update(self.selected_order)
             if self.selected_order.op == Order.Operation.op_b:
                 self.naked += self.selected_order.lot
             else:
                 self.naked -= self.selected_order.lot
+            if self.journal is not None:
+                self.journal.record(Event.activate, self.selected_order, time, price,
+                                    self.selected_order.open_reason)
 
     def order_info(self, info):
         if info == Info.identifier:
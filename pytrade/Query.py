@@ -1,8 +1,15 @@
 from Common import config_info
 from scipy import io
 from Exception import *
+import numpy as np
+import numbers
 import csv
 
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
 
 class Bar:
     def __init__(self, o, h, l, c):
@@ -12,16 +19,154 @@ class Bar:
         self.bar_close = c
 
 
+def _value(level):
+    return None if np.isnan(level) else float(level)
+
+
+def _merge(prev, value, func):
+    if prev is None:
+        return value
+    if value is None:
+        return prev
+    return func(prev, value)
+
+
+class ResampledView:
+    """Bars of a higher timeframe, each made of [int]timeframe bars of the data source.
+
+    The completed bars are aggregated once over the whole price columns. The
+    in-progress bar is kept apart and updated bar by bar with update(), so
+    that it never looks beyond the current time.
+
+    properties:
+    [ndarray]opens, highs, lows, closes: columns of the completed bars, NaN where
+    the data source has no such column
+    """
+    def __init__(self, prices, timeframe):
+        self.timeframe = timeframe
+        self.prices = prices
+        self.time = -1
+        self.current = None
+
+        # aggregate chunk by chunk, each chunk holding whole bars of the timeframe
+        n = len(prices) // timeframe * timeframe
+        step = max(1, prices.chunk_rows // timeframe) * timeframe
+        parts = []
+        for begin in range(0, n, step):
+            end = min(begin + step, n)
+            o, h, l, c = [np.full(end - begin, np.nan) if column is None else np.asarray(column, dtype=np.float64)
+                          for column in prices.read(begin, end)]
+            starts = np.arange(0, end - begin, timeframe)
+            parts.append((o[starts], np.maximum.reduceat(h, starts),
+                          np.minimum.reduceat(l, starts), c[starts + timeframe - 1]))
+        if not parts:
+            self.opens = self.highs = self.lows = self.closes = np.empty(0)
+            return
+        self.opens, self.highs, self.lows, self.closes = [np.concatenate(column) for column in zip(*parts)]
+
+    def update(self, time):
+        time = min(time, len(self.prices) - 1)
+        for t in range(self.time + 1, time + 1):
+            bar = self.prices[t]
+            if t % self.timeframe == 0 or self.current is None:
+                self.current = Bar(bar.bar_open, bar.bar_high, bar.bar_low, bar.bar_close)
+            else:
+                self.current.bar_high = _merge(self.current.bar_high, bar.bar_high, max)
+                self.current.bar_low = _merge(self.current.bar_low, bar.bar_low, min)
+                self.current.bar_close = bar.bar_close
+        self.time = max(self.time, time)
+
+    def get(self, shift):
+        if shift == 0 and self.current is not None:
+            current = self.current
+            return Bar(current.bar_open, current.bar_high, current.bar_low, current.bar_close)
+        index = self.time // self.timeframe - shift
+        if shift < 0 or index < 0:
+            raise NoPriceException(shift)
+        return Bar(_value(self.opens[index]), _value(self.highs[index]),
+                   _value(self.lows[index]), _value(self.closes[index]))
+
+
+class BarSeries:
+    """The Bars of a data source, built from its columns on access.
+
+    [callable]read(begin, end) returns the open, high, low and close columns of
+    the rows begin..end as arrays, None for a column the data source does not
+    have. Rows are read [int]chunk_rows at a time and only the current chunk
+    is kept, so a source read lazily from disk never has to fit in memory.
+    """
+    def __init__(self, read, rows, chunk_rows):
+        self.read = read
+        self.rows = rows
+        self.chunk_rows = max(1, chunk_rows)
+        self.chunk_begin = None
+        self.chunk = None
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += self.rows
+        if not 0 <= row < self.rows:
+            raise IndexError(row)
+        begin = row - row % self.chunk_rows
+        if begin != self.chunk_begin:
+            self.chunk = self.read(begin, min(begin + self.chunk_rows, self.rows))
+            self.chunk_begin = begin
+        i = row - begin
+        return Bar(*[None if column is None else float(column[i]) for column in self.chunk])
+
+
+class MatMatrix:
+    """A single matrix variable of a .mat file, read column by column.
+
+    Only the variable [str]matrix_name is loaded from v4-v7 files. v7.3 files
+    are HDF5 containers (requires h5py); their dataset is left open on disk and
+    only the requested rows of the requested columns are read. MATLAB stores it
+    column-major, so the dataset is the transpose of the matrix.
+    """
+    def __init__(self, file_name, matrix_name):
+        self.h5 = None
+        try:
+            variables = io.loadmat(file_name, variable_names=[matrix_name])
+        except NotImplementedError:
+            variables = None
+
+        if variables is not None:
+            if matrix_name not in variables:
+                raise PriceFormFormatException(file_name)
+            self.data = variables[matrix_name]
+            self.rows = self.data.shape[0]
+            return
+
+        if h5py is None:
+            raise PriceFormFormatException(file_name)
+        self.h5 = h5py.File(file_name, "r")
+        if matrix_name not in self.h5:
+            self.h5.close()
+            raise PriceFormFormatException(file_name)
+        self.data = self.h5[matrix_name]
+        self.rows = self.data.shape[1]
+
+    def column(self, col, begin, end):
+        if self.h5 is not None:
+            return self.data[col, begin:end]
+        return self.data[begin:end, col]
+
+    def close(self):
+        if self.h5 is not None:
+            self.h5.close()
+
+
 class PriceProvider:
     def __init__(self):
         self.time = 0
         self.total_rows = 0
+        self.views = {}
         fpath = config_info["data_source"]
         tokens = fpath.split('.')
         file_fmt = tokens[-1]
-        self.prices = [Bar(None, None, None, None)]
-        del self.prices[0]
-
         if file_fmt == "csv":
             oc = config_info["open"]
             hc = config_info["high"]
@@ -45,18 +190,20 @@ class PriceProvider:
                 if config_info["end_at_row"] is None else config_info["end_at_row"]
             self.total_rows = row_end - row_begin + 1
 
-            for row in range(0, row_end):
-                o = float(data[row][oc]) if oc is not None else None
-                h = float(data[row][hc]) if hc is not None else None
-                l = float(data[row][lc]) if lc is not None else None
-                c = float(data[row][cc]) if cc is not None else None
-                self.prices.append(Bar(o, h, l, c))
+            columns = [np.array([float(row[col]) for row in data[:row_end]], dtype=np.float64)
+                       if col is not None else None
+                       for col in (oc, hc, lc, cc)]
+            self.prices = BarSeries(
+                lambda begin, end: [column[begin:end] if column is not None else None for column in columns],
+                row_end,
+                row_end
+            )
 
         elif file_fmt == "mat":
-            mat = io.loadmat(fpath)
-            data = mat[config_info["matrix_name"]]
+            matrix = MatMatrix(fpath, config_info["matrix_name"])
+            chunk_rows = config_info.get("mat_chunk_rows", 65536)
             row_begin = config_info["begin_at_row"]
-            row_end = len(data) \
+            row_end = matrix.rows \
                 if config_info["end_at_row"] is None else config_info["end_at_row"]
             self.total_rows = row_end - row_begin + 1
 
@@ -65,12 +212,14 @@ class PriceProvider:
             lc = config_info["low"]
             cc = config_info["close"]
 
-            for row in range(row_begin, row_end):
-                o = data[row][oc] if oc is not None else None
-                h = data[row][hc] if hc is not None else None
-                l = data[row][lc] if lc is not None else None
-                c = data[row][cc] if cc is not None else None
-                self.prices.append(Bar(o, h, l, c))
+            self.matrix = matrix
+            self.prices = BarSeries(
+                lambda begin, end: [matrix.column(col, row_begin + begin, row_begin + end)
+                                    if col is not None else None
+                                    for col in (oc, hc, lc, cc)],
+                row_end - row_begin,
+                chunk_rows
+            )
         else:
             raise PriceFormFormatException(fpath)
 
@@ -78,3 +227,17 @@ class PriceProvider:
         if shift < 0:
             raise NoPriceException(shift)
         return self.prices[shift]
+
+    def resampled(self, timeframe):
+        if not isinstance(timeframe, numbers.Integral) or timeframe < 1:
+            raise InvalidTimeframeException(timeframe)
+        if timeframe not in self.views:
+            self.views[timeframe] = ResampledView(self.prices, timeframe)
+        view = self.views[timeframe]
+        view.update(self.time)
+        return view
+
+    def step(self):
+        self.time += 1
+        for view in self.views.values():
+            view.update(self.time)
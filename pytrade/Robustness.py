@@ -0,0 +1,127 @@
+from Order import Order
+from Exception import InvalidBalanceException
+from multiprocessing import Pool
+import numpy as np
+
+
+class Method:
+    def __init__(self):
+        pass
+
+    shuffle = 0    # permute the order of the increments
+    bootstrap = 1  # resample blocks of increments with replacement
+
+
+class RobustnessResult:
+    """properties:
+    [ndarray]final_balance: final balance of every simulated path
+
+    [ndarray]max_drawdown: largest fall from a running peak of every simulated
+    path, as a fraction of that peak
+
+    [double]ruin_probability: fraction of the paths whose balance reaches the
+    ruin level at any time
+    """
+    def __init__(self, final_balance, max_drawdown, ruined):
+        self.final_balance = final_balance
+        self.max_drawdown = max_drawdown
+        self.ruin_probability = float(np.mean(ruined)) if len(ruined) else 0.0
+
+
+def trade_pnls(hist_orders):
+    """Realized profit of every closed position of OrderList.hist_orders, in
+    closing order. Pending orders cancelled before being activated are skipped.
+    """
+    pnls = []
+    for order in hist_orders.values():
+        if order.op == Order.Operation.op_b:
+            pnls.append((order.close_price - order.open_price) * order.lot)
+        elif order.op == Order.Operation.op_s:
+            pnls.append((order.open_price - order.close_price) * order.lot)
+    return np.array(pnls, dtype=np.float64)
+
+
+def equity_returns(balance):
+    """Bar by bar balance changes of the equity curve built by TradingEnvironment.run."""
+    return np.diff(np.asarray(balance, dtype=np.float64))
+
+
+def shuffle_paths(increments, simulations, rng):
+    order = np.argsort(rng.random_sample((simulations, len(increments))), axis=1)
+    return increments[order]
+
+
+def block_bootstrap_paths(increments, simulations, block_size, rng):
+    n = len(increments)
+    block_size = max(1, min(block_size, n))
+    blocks = -(-n // block_size)
+    starts = rng.randint(0, n - block_size + 1, size=(simulations, blocks))
+    index = (starts[:, :, np.newaxis] + np.arange(block_size)).reshape(simulations, -1)[:, :n]
+    return increments[index]
+
+
+def path_statistics(paths, initial_balance, ruin_level):
+    """Returns (final balance, max drawdown, ruined) of every row of paths."""
+    equity = initial_balance + np.cumsum(paths, axis=1)
+    peak = np.maximum(np.maximum.accumulate(equity, axis=1), initial_balance)
+    drawdown = (peak - equity) / peak
+    final_balance = equity[:, -1] if paths.shape[1] else np.full(len(paths), float(initial_balance))
+    max_drawdown = drawdown.max(axis=1) if paths.shape[1] else np.zeros(len(paths))
+    ruined = (equity <= ruin_level).any(axis=1)
+    return final_balance, max_drawdown, ruined
+
+
+def _simulate(args):
+    increments, method, simulations, block_size, initial_balance, ruin_level, seed = args
+    rng = np.random.RandomState(seed)
+    if method == Method.shuffle:
+        paths = shuffle_paths(increments, simulations, rng)
+    else:
+        paths = block_bootstrap_paths(increments, simulations, block_size, rng)
+    return path_statistics(paths, initial_balance, ruin_level)
+
+
+def run_robustness(increments, initial_balance, method=Method.bootstrap, simulations=1000,
+                   block_size=1, ruin_level=0, seed=None, processes=None, chunk_size=250):
+    """Simulate resampled balance paths and collect their distributions.
+
+    [ndarray]increments: balance changes to resample, from trade_pnls for a
+    trade ledger or equity_returns for an equity curve
+
+    [int]method: Method.shuffle keeps the increments and only permutes them,
+    Method.bootstrap draws blocks of [int]block_size consecutive increments
+    with replacement (block_size 1 is the plain bootstrap)
+
+    [int]seed: the simulations are split into chunks of [int]chunk_size paths,
+    each drawn from its own RandomState seeded from [int]seed, so the result
+    does not depend on [int]processes. processes=1 runs in this process.
+
+    [double]initial_balance must be positive, as drawdowns are fractions of
+    the balance; add the trading capital to resample a profit-only ledger.
+    """
+    if not initial_balance > 0:
+        raise InvalidBalanceException(initial_balance)
+    increments = np.asarray(increments, dtype=np.float64)
+    master = np.random.RandomState(seed)
+    sizes = [chunk_size] * (simulations // chunk_size)
+    if simulations % chunk_size:
+        sizes.append(simulations % chunk_size)
+    seeds = master.randint(0, 2 ** 31 - 1, size=len(sizes)).tolist()
+    tasks = [(increments, method, size, block_size, initial_balance, ruin_level, chunk_seed)
+             for size, chunk_seed in zip(sizes, seeds)]
+
+    if processes == 1:
+        results = list(map(_simulate, tasks))
+    else:
+        pool = Pool(processes)
+        try:
+            results = pool.map(_simulate, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+    if not results:
+        empty = np.empty(0)
+        return RobustnessResult(empty, empty, empty)
+    final_balance, max_drawdown, ruined = [np.concatenate(column) for column in zip(*results)]
+    return RobustnessResult(final_balance, max_drawdown, ruined)
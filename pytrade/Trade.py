@@ -4,7 +4,44 @@ from OrderList import OrderList, SelectMethod
 from Query import PriceProvider
 from Common import config_info
 from Order import Order
+from Matching import OrderBook, Action
+from Journal import Journal
 from matplotlib import pyplot
+import numpy as np
+
+
+def _levels(values, n, name):
+    # price levels as a float array of length n, None meaning NaN
+    if values is None:
+        return np.full(n, np.nan)
+    levels = np.array(values, dtype=np.float64)
+    if levels.ndim == 0:
+        return np.full(n, float(levels))
+    if levels.shape != (n,):
+        raise BatchLengthException(name, len(levels), n)
+    return levels
+
+
+def _column(values, n, name):
+    # any other argument as a list of length n
+    if values is None or np.ndim(values) == 0:
+        return [values] * n
+    if len(values) != n:
+        raise BatchLengthException(name, len(values), n)
+    return list(values)
+
+
+def _lots(values, n):
+    # lots as given by the caller, each one required and finite
+    lots = _column(values, n, "lots")
+    invalid = np.flatnonzero(~np.isfinite(np.array(lots, dtype=np.float64)))
+    if len(invalid):
+        raise InvalidLotException(lots[invalid[0]])
+    return lots
+
+
+def _optional(levels):
+    return [None if np.isnan(level) else level for level in levels.tolist()]
 
 
 class TradingEnvironment:
@@ -24,21 +61,31 @@ class TradingEnvironment:
         self.leverage = config_info["leverage"]
         self.point = config_info["point"]
         self.nearest_sl = config_info["nearest_sl"]
+        self.vectorized_matching = config_info.get("vectorized_matching", False)
+        if self.vectorized_matching:
+            self.order_pool.book = OrderBook()
+            self.order_pool.book.add_many(self.order_pool.active_orders.values())
+        self.journal_file = config_info.get("journal")
 
-    def KLine(self, shift=0):
-        return self.price.get(shift)
+    def KLine(self, shift=0, timeframe=1):
+        return self.__bar(shift, timeframe)
 
-    def Open(self, shift=0):
-        return self.price.get(self.Time - shift).bar_open
+    def __bar(self, shift, timeframe):
+        if timeframe == 1:
+            return self.price.get(self.Time - shift)
+        return self.price.resampled(timeframe).get(shift)
 
-    def High(self, shift=0):
-        return self.price.get(self.Time - shift).bar_high
+    def Open(self, shift=0, timeframe=1):
+        return self.__bar(shift, timeframe).bar_open
 
-    def Low(self, shift=0):
-        return self.price.get(self.Time - shift).bar_low
+    def High(self, shift=0, timeframe=1):
+        return self.__bar(shift, timeframe).bar_high
 
-    def Close(self, shift=0):
-        return self.price.get(self.Time - shift).bar_close
+    def Low(self, shift=0, timeframe=1):
+        return self.__bar(shift, timeframe).bar_low
+
+    def Close(self, shift=0, timeframe=1):
+        return self.__bar(shift, timeframe).bar_close
 
     @abstractmethod
     def on_bar(self):
@@ -58,7 +105,7 @@ class TradingEnvironment:
 
     def __next_day(self):
         self.Time += 1
-        self.price.time += 1
+        self.price.step()
 
     def OrderSend(self, op, open_price, lot, tp=None, sl=None, expired_time=None):
         if Order.Operation.is_market(op):
@@ -119,9 +166,66 @@ class TradingEnvironment:
             )
             return identifier
 
+    def OrderSendMany(self, ops, open_prices, lots, tps=None, sls=None, expired_times=None):
+        """Send many orders at once. Returns the list of their identifiers.
+
+        ops, open_prices, lots, tps, sls and expired_times are sequences of the
+        arguments of OrderSend, where None stands for a missing tp or sl level.
+        A single value is used for every order, and a sequence of any other
+        length raises BatchLengthException. A pending order needs an open
+        price. All the orders are validated
+        before any of them is sent; the exception raised is the one OrderSend
+        would raise for the first invalid order.
+        """
+        ops = np.atleast_1d(np.array(ops, dtype=np.int64))
+        n = len(ops)
+        lots = _lots(lots, n)
+        tps = _levels(tps, n, "tps")
+        sls = _levels(sls, n, "sls")
+        expired_times = _column(expired_times, n, "expired_times")
+
+        is_market = (ops & Order.Operation.aux_is_mkt) == 0
+        is_buy = (ops & Order.Operation.op_s) == 0
+        open_prices = np.where(is_market, self.MarketPrice, _levels(open_prices, n, "open_prices"))
+
+        gap = self.point * self.nearest_sl
+        # missing levels are NaN, which compare False
+        with np.errstate(invalid="ignore"):
+            invalid_levels = np.where(
+                is_buy,
+                (tps < open_prices) | (open_prices - sls < gap),
+                (tps > open_prices) | (sls - open_prices < gap)
+            )
+            invalid_open_price = \
+                (((ops & Order.Operation.aux_is_bl_ss) != 0) & (open_prices > self.MarketPrice)) | \
+                (((ops & Order.Operation.aux_is_bs_sl) != 0) & (open_prices < self.MarketPrice))
+
+        missing_open_price = np.isnan(open_prices)
+
+        invalid = np.flatnonzero(invalid_levels | invalid_open_price | missing_open_price)
+        if len(invalid):
+            i = invalid[0]
+            if invalid_levels[i]:
+                raise InvalidTpOrSlException(_optional(tps)[i], _optional(sls)[i])
+            raise InvalidOpenPriceException(_optional(open_prices)[i], self.MarketPrice, int(ops[i]))
+
+        return self.order_pool.order_send_many(
+            ops.tolist(),
+            self.Time,
+            open_prices.tolist(),
+            lots,
+            expired_times,
+            Order.Reason.open_at_mk,
+            _optional(tps),
+            _optional(sls)
+        )
+
     def OrderClose(self, identifier):
         self.order_pool.order_close(identifier, self.Time, self.MarketPrice, Order.Reason.close_at_mk)
 
+    def OrderCloseMany(self, identifiers):
+        self.order_pool.order_close_many(identifiers, self.Time, self.MarketPrice, Order.Reason.close_at_mk)
+
     def OrderSelect(self, identifier, select_mode=SelectMethod.by_pos):
         self.order_pool.order_select(identifier, select_mode)
 
@@ -154,28 +258,103 @@ class TradingEnvironment:
             if self.order_pool.selected_order.open_price < self.MarketPrice:
                 raise InvalidOpenPriceException(new_price, self.MarketPrice, op)
 
-        self.order_pool.order_modify(identifier, new_price, new_tp, new_sl, expired_time)
+        self.order_pool.order_modify(identifier, new_price, new_tp, new_sl, expired_time, self.Time)
+
+    def OrderModifyMany(self, identifiers, new_prices=None, new_tps=None, new_sls=None, expired_times=None):
+        """Modify many orders at once, with the same checks as OrderModify.
+
+        None stands for an unchanged value, both for a whole argument and for
+        the items of a sequence. A single value is used for every order. The
+        identifiers must be distinct. All the orders are validated before any
+        of them is modified.
+        """
+        orders = self.order_pool.order_select_many(identifiers)
+        n = len(orders)
+        ops = np.fromiter((order.op for order in orders), dtype=np.int64, count=n)
+        open_prices = np.fromiter((order.open_price for order in orders), dtype=np.float64, count=n)
+        new_prices = _levels(new_prices, n, "new_prices")
+        new_tps = _levels(new_tps, n, "new_tps")
+        new_sls = _levels(new_sls, n, "new_sls")
+        expired_times = _column(expired_times, n, "expired_times")
+
+        is_buy = (ops & Order.Operation.op_s) == 0
+        gap = self.point * self.nearest_sl
+        # missing levels are NaN, which compare False
+        with np.errstate(invalid="ignore"):
+            invalid_levels = np.where(
+                is_buy,
+                (new_tps < self.MarketPrice) | (self.MarketPrice - new_sls < gap),
+                (new_tps > self.MarketPrice) | (new_sls - self.MarketPrice < gap)
+            )
+            invalid_open_price = \
+                (((ops & Order.Operation.aux_is_bl_ss) != 0) & (open_prices > self.MarketPrice)) | \
+                (((ops & Order.Operation.aux_is_bs_sl) != 0) & (open_prices < self.MarketPrice))
+        market_price_modified = ((ops & Order.Operation.aux_is_mkt) == 0) & ~np.isnan(new_prices)
+
+        invalid = np.flatnonzero(invalid_levels | invalid_open_price | market_price_modified)
+        if len(invalid):
+            i = invalid[0]
+            if invalid_levels[i]:
+                raise InvalidTpOrSlException(_optional(new_tps)[i], _optional(new_sls)[i])
+            if invalid_open_price[i]:
+                raise InvalidOpenPriceException(_optional(new_prices)[i], self.MarketPrice, int(ops[i]))
+            raise MarketOrderOpenPriceModifiedException(orders[i].identifier)
+
+        self.order_pool.order_modify_many(
+            [order.identifier for order in orders],
+            _optional(new_prices),
+            _optional(new_tps),
+            _optional(new_sls),
+            expired_times,
+            self.Time
+        )
+
+    def __match_orders(self, prev_price, new_price):
+        identifiers, actions = self.order_pool.book.match(prev_price, new_price)
+        for identifier, action in zip(identifiers, actions):
+            if action == Action.activate:
+                self.order_pool.order_activate(new_price, identifier, self.Time)
+            elif action == Action.close_tp:
+                self.order_pool.order_close(identifier, self.Time, new_price, Order.Reason.close_at_tp)
+            else:
+                self.order_pool.order_close(identifier, self.Time, new_price, Order.Reason.close_at_sl)
 
     def run(self):
         new_price = self.price.prices[0].bar_close
         self.MarketPrice = new_price
+        try:
+            if self.journal_file is not None:
+                self.order_pool.journal = Journal(self.journal_file)
+            self.__run()
+        finally:
+            if self.order_pool.journal is not None:
+                self.order_pool.journal.close()
+                self.order_pool.journal = None
+        pyplot.plot(self.balance)
+        pyplot.show()
+
+    def __run(self):
+        new_price = self.MarketPrice
         self.on_init()
         while self.Time < self.price.total_rows-1:
             prev_price = new_price
             new_price = self.price.prices[self.Time].bar_close
+            self.MarketPrice = new_price
 
             # calculate net
             self.balance.append(
                 self.balance[-1] + (new_price - prev_price)*self.order_pool.naked
             )
             # stop loss, take profit, buy limit, buy stop, sell limit, sell stop
-            if new_price > prev_price:
+            if self.vectorized_matching and self.order_pool.book.size >= OrderBook.min_size:
+                self.__match_orders(prev_price, new_price)
+            elif new_price > prev_price:
                 # when price goes up
                 for order in self.order_pool.active_orders.values():
                     if Order.Operation.is_bs_or_sl(order.op):
                         if order.open_price < new_price:
                             # buy stop or sell limit activated
-                            self.order_pool.order_activate(order.identifier, new_price)
+                            self.order_pool.order_activate(new_price, order.identifier, self.Time)
                     elif order.op == Order.Operation.op_b and order.tp is not None and order.tp < new_price:
                         self.order_pool.order_close(order.identifier, self.Time, new_price, Order.Reason.close_at_tp)
                     elif order.op == Order.Operation.op_s and order.sl is not None and order.sl < new_price:
@@ -186,7 +365,7 @@ class TradingEnvironment:
                     if Order.Operation.is_bl_or_ss(order.op):
                         if order.open_price > new_price:
                             # buy limit or sell stop activated
-                            self.order_pool.order_activate(order.identifier, new_price)
+                            self.order_pool.order_activate(new_price, order.identifier, self.Time)
                     elif order.op == Order.Operation.op_b and order.sl is not None and order.sl > new_price:
                         self.order_pool.order_close(order.identifier, self.Time, new_price, Order.Reason.close_at_sl)
                     elif order.op == Order.Operation.op_s and order.tp is not None and order.tp > new_price:
@@ -195,5 +374,3 @@ class TradingEnvironment:
             self.on_bar()
             self.__next_day()
         self.on_deinit()
-        pyplot.plot(self.balance)
-        pyplot.show()